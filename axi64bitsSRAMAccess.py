@@ -5,14 +5,20 @@
 # Copyright (c) 2023 Gwenhael Goavec-Merou <gwenhael@enjoy-digital.fr>
 # SPDX-License-Identifier: BSD-2-Clause
 
+import os
+import sys
+import shutil
+import hashlib
+import logging
 import argparse
+import subprocess
 
 from migen import *
-from migen.genlib.misc import timeline
 
 from litex.gen import *
 
 from litex.build.generic_platform import *
+from litex.build                  import sim as litex_sim
 from litex.build.sim              import SimPlatform
 from litex.build.sim.config       import SimConfig
 from litex.build.sim.verilator    import verilator_build_args, verilator_build_argdict
@@ -31,84 +37,143 @@ from utils import *
 
 # Utils --------------------------------------------------------------------------------------------
 
+def _axi_consts(addressing, init_adr, max_len, dw):
+    """Return (init_adr, incr_adr, max_len, strb), addresses expressed in bus addressing unit, strb as
+    an all-lanes dw//8 bits Constant."""
+    shift = 0 if addressing == "byte" else log2_int(dw//8)
+    return (init_adr >> shift, (dw//8) >> shift, max_len >> shift, Constant(2**(dw//8) - 1, dw//8))
+
 class AXIPacketStreamer(LiteXModule):
-    def __init__(self, addressing="byte", init_adr=0, init_val=0, dw=32, adr_width=64, max_len=0x100):
-        self.bus = bus = axi.AXILiteInterface(
+    def __init__(self, addressing="byte", init_adr=0, init_val=0, dw=32, adr_width=64, max_len=0x100,
+        burst_len   = 16,
+        outstanding = 8):
+        self.bus = bus = axi.AXIInterface(
             data_width    = dw,
             address_width = adr_width,
-            addressing    = addressing)
+            addressing    = addressing,
+            id_width      = 1)
 
-        self.end   = Signal()
-        self.start = Signal()
+        self.end        = Signal()
+        self.start      = Signal()
+        self.reload     = Signal()
+        self.reload_adr = Signal(adr_width) # Byte address, max_len aligned.
+        self.reload_val = Signal(dw)
 
         # # #
 
         # Parameters.
         # -----------
-        _init_adr = init_adr if addressing == "byte" else init_adr >> 2
-        _incr_adr = 4 if addressing == "byte" else 1
-        _max_len  = max_len if addressing == "byte" else max_len >> 2
+        _init_adr, _incr_adr, _max_len, _strb = _axi_consts(addressing, init_adr, max_len, dw)
+        _nbeats   = _max_len//_incr_adr
+        _nbursts  = _nbeats//burst_len
+        assert burst_len <= 256 # AXI4 INCR burst limit.
+        assert _nbeats % burst_len == 0
+
+        # Window is max_len aligned: upper address bits only change on reload, only the offset counts.
+        _offset_bits = log2_int(_max_len)
+        assert _init_adr % _max_len == 0
 
         # Signals.
         # --------
-        base_addr = Signal(adr_width)
-        sent_data = Signal(dw)
+        adr_msb    = Signal(adr_width - _offset_bits, reset=_init_adr >> _offset_bits)
+        data_init  = Signal(dw, reset=init_val)
+        aw_offset  = Signal(_offset_bits)
+        sent_data  = Signal(dw)
+        beat_cnt   = Signal(max=burst_len + 1)
+        aw_cnt     = Signal(max=_nbursts + 1) # Bursts issued on AW.
+        w_cnt      = Signal(max=_nbursts + 1) # Bursts sent on W.
+        b_cnt      = Signal(max=_nbursts + 1) # Bursts acknowledged on B.
+        reset_cnt  = Signal()
+        aw_advance = Signal()
+        w_advance  = Signal()
+        b_advance  = Signal()
+
+        # Counters.
+        # ---------
+        # Kept out of the FSM: the FSM only emits reset_cnt/handshakes.
+        self.comb += [
+            aw_advance.eq(bus.aw.valid & bus.aw.ready),
+            w_advance.eq(bus.w.valid & bus.w.ready),
+            b_advance.eq(bus.b.valid & bus.b.ready),
+        ]
+        self.sync += [
+            If(self.reload,
+                adr_msb.eq(self.reload_adr[log2_int(max_len):]),
+                data_init.eq(self.reload_val),
+            ),
+            If(reset_cnt,
+                aw_offset.eq(0),
+                sent_data.eq(data_init),
+                beat_cnt.eq(0),
+                aw_cnt.eq(0),
+                w_cnt.eq(0),
+                b_cnt.eq(0),
+            ).Else(
+                If(aw_advance,
+                    aw_offset.eq(aw_offset + burst_len*_incr_adr),
+                    aw_cnt.eq(aw_cnt + 1),
+                ),
+                If(w_advance,
+                    sent_data.eq(sent_data + 1),
+                    If(bus.w.last,
+                        beat_cnt.eq(0),
+                        w_cnt.eq(w_cnt + 1),
+                    ).Else(
+                        beat_cnt.eq(beat_cnt + 1),
+                    )
+                ),
+                If(b_advance,
+                    b_cnt.eq(b_cnt + 1),
+                )
+            )
+        ]
 
         # FSM.
         # ----
+        # AW, W and B channels run concurrently: up to outstanding bursts may be in flight
+        # and B responses are collected without blocking the next address phase.
         self.fsm = fsm = FSM(reset_state="IDLE")
         fsm.act("IDLE",
-            NextValue(base_addr, _init_adr),
-            NextValue(sent_data, init_val),
+            reset_cnt.eq(1),
             If(self.start,
-                NextState("WR_DAT-ADR"),
+                NextState("WR"),
             )
         ),
-        fsm.act("WR_DAT-ADR",
-            bus.aw.valid.eq(1),
-            bus.aw.addr.eq(base_addr),
+        fsm.act("WR",
+            # Address Phase.
+            bus.aw.valid.eq((aw_cnt != _nbursts) & ((aw_cnt - b_cnt) < outstanding)),
+            bus.aw.addr.eq(Cat(aw_offset, adr_msb)),
+            bus.aw.len.eq(burst_len - 1),
+            bus.aw.size.eq(log2_int(dw//8)),
+            bus.aw.burst.eq(axi.BURST_INCR),
+            # Data Phase.
+            bus.w.valid.eq(w_cnt != aw_cnt),
             bus.w.data.eq(sent_data),
-            bus.w.valid.eq(1),
-            bus.w.strb.eq(2**(32//8) - 1),
-            If(bus.aw.ready,
-                If(bus.w.ready,
-                    NextState("WAIT_B"),
-                ).Else(
-                    NextState("WAIT_DAT"),
-                )
-            ),
-        ),
-        fsm.act("WAIT_DAT",
-            bus.w.valid.eq(1),
-            bus.w.strb.eq(2**(32//8) - 1),
-            If(bus.w.ready,
-               NextValue(bus.w.strb, 0),
-               NextState("WAIT_B")
-            ),
-        ),
-        fsm.act("WAIT_B",
+            bus.w.strb.eq(_strb),
+            bus.w.last.eq(beat_cnt == burst_len - 1),
+            # Response Phase.
             bus.b.ready.eq(1),
-            If(bus.b.valid,
-                NextValue(base_addr, base_addr + _incr_adr),
-                NextValue(sent_data, sent_data + 1),
-                If(_init_adr + _max_len - _incr_adr == base_addr,
-                    self.end.eq(1),
-                    NextState("IDLE"),
-                ).Else(
-                    NextState("WR_DAT-ADR"),
-                )
+            If(bus.b.valid & (b_cnt == _nbursts - 1),
+                self.end.eq(1),
+                NextState("IDLE"),
             )
         )
 
 class AXIPacketChecker(LiteXModule):
-    def __init__(self, addressing="byte", init_adr=0, init_val=0, dw=32, adr_width=64, max_len=0x100, verbose=True):
-        self.bus = bus = axi.AXILiteInterface(
+    def __init__(self, addressing="byte", init_adr=0, init_val=0, dw=32, adr_width=64, max_len=0x100, verbose=True,
+        burst_len   = 16,
+        outstanding = 8):
+        self.bus = bus = axi.AXIInterface(
             data_width    = dw,
             address_width = adr_width,
-            addressing    = addressing)
+            addressing    = addressing,
+            id_width      = 1)
 
-        self.end   = Signal()
-        self.start = Signal()
+        self.end        = Signal()
+        self.start      = Signal()
+        self.reload     = Signal()
+        self.reload_adr = Signal(adr_width) # Byte address, max_len aligned.
+        self.reload_val = Signal(dw)
 
         # # #
 
@@ -116,108 +181,135 @@ class AXIPacketChecker(LiteXModule):
         # -----------
         self.dw        = dw
         self.adr_width = adr_width
-        _init_adr      = init_adr if addressing == "byte" else init_adr >> 2
-        _incr_adr      = 4 if addressing == "byte" else 1
-        _max_len       = max_len if addressing == "byte" else max_len >> 2
+        _init_adr, _incr_adr, _max_len, _ = _axi_consts(addressing, init_adr, max_len, dw)
+        _nbeats        = _max_len//_incr_adr
+        _nbursts       = _nbeats//burst_len
+        assert burst_len <= 256 # AXI4 INCR burst limit.
+        assert _nbeats % burst_len == 0
+
+        # Window is max_len aligned: upper address bits only change on reload, only the offsets count.
+        _offset_bits   = log2_int(_max_len)
+        assert _init_adr % _max_len == 0
 
         # Signals.
         # --------
         self.data_error = Signal()
         self.base_addr  = Signal(adr_width)
         self.recv_data  = Signal(dw)
+        adr_msb         = Signal(adr_width - _offset_bits, reset=_init_adr >> _offset_bits)
+        data_init       = Signal(dw, reset=init_val)
+        offset          = Signal(_offset_bits)
+        ar_offset       = Signal(_offset_bits)
+        ar_cnt          = Signal(max=_nbursts + 1) # Bursts issued on AR.
+        r_cnt           = Signal(max=_nbursts + 1) # Bursts received on R.
+        reset_cnt       = Signal()
+        ar_advance      = Signal()
+        r_advance       = Signal()
+
+        # Counters.
+        # ---------
+        # Kept out of the FSM: the FSM only emits reset_cnt/handshakes.
+        self.comb += [
+            ar_advance.eq(bus.ar.valid & bus.ar.ready),
+            r_advance.eq(bus.r.valid & bus.r.ready),
+            self.base_addr.eq(Cat(offset, adr_msb)),
+        ]
+        self.sync += [
+            If(self.reload,
+                adr_msb.eq(self.reload_adr[log2_int(max_len):]),
+                data_init.eq(self.reload_val),
+            ),
+            If(reset_cnt,
+                ar_offset.eq(0),
+                ar_cnt.eq(0),
+                r_cnt.eq(0),
+                offset.eq(0),
+                self.recv_data.eq(data_init),
+            ).Else(
+                If(ar_advance,
+                    ar_offset.eq(ar_offset + burst_len*_incr_adr),
+                    ar_cnt.eq(ar_cnt + 1),
+                ),
+                If(r_advance,
+                    offset.eq(offset + _incr_adr),
+                    self.recv_data.eq(self.recv_data + 1),
+                    If(bus.r.last,
+                        r_cnt.eq(r_cnt + 1),
+                    )
+                )
+            )
+        ]
 
         # FSM.
         # ----
+        # AR and R channels run concurrently: up to outstanding bursts may be in flight and
+        # R is always ready, expected data/address being tracked in order (single ID).
         self.fsm = fsm = FSM(reset_state="IDLE")
         fsm.act("IDLE",
-            NextValue(self.base_addr, _init_adr),
-            NextValue(self.recv_data, init_val),
+            reset_cnt.eq(1),
             If(self.start,
-                NextState("RD_ADDR"),
-            )
-        ),
-        fsm.act("RD_ADDR",
-            bus.ar.valid.eq(1),
-            bus.ar.addr.eq(self.base_addr),
-            If(bus.ar.ready,
-               NextState("RD_DAT"),
+                NextState("RD"),
             )
         ),
-        fsm.act("RD_DAT",
+        fsm.act("RD",
+            # Address Phase.
+            bus.ar.valid.eq((ar_cnt != _nbursts) & ((ar_cnt - r_cnt) < outstanding)),
+            bus.ar.addr.eq(Cat(ar_offset, adr_msb)),
+            bus.ar.len.eq(burst_len - 1),
+            bus.ar.size.eq(log2_int(dw//8)),
+            bus.ar.burst.eq(axi.BURST_INCR),
+            # Data Phase.
             bus.r.ready.eq(1),
             If(bus.r.valid,
                 If(bus.r.data != self.recv_data,
                     self.data_error.eq(1),
                 ),
-                NextState("WAIT_RD_ACK"),
-            )
-        ),
-        fsm.act("WAIT_RD_ACK",
-            NextValue(self.base_addr, self.base_addr + _incr_adr),
-            NextValue(self.recv_data, self.recv_data + 1),
-            If(_init_adr + _max_len - _incr_adr == self.base_addr,
-               self.end.eq(1),
-                NextState("IDLE"),
-            ).Else(
-                NextState("RD_ADDR"),
+                If(bus.r.last & (r_cnt == _nbursts - 1),
+                    self.end.eq(1),
+                    NextState("IDLE"),
+                )
             )
         )
 
+        # Per-beat trace, enabled at runtime with +verbose on the simulation command line (batched
+        # through SimBeatLog, its C source must be added to the platform).
         if verbose:
-            self.sync += [
-                If(bus.r.valid & bus.r.ready,
-                    Display("addr %08x dat_r %08x -> %08x",
-                        self.base_addr, self.recv_data, bus.r.data),
-                )
-            ]
+            self.verbose_en = Signal()
+            log_en          = Signal()
+            self.specials += SimPlusArg("verbose", self.verbose_en)
+            self.comb += log_en.eq(self.verbose_en & bus.r.valid & bus.r.ready)
+            self.specials += SimBeatLog(log_en, self.base_addr, bus.r.data, self.recv_data)
 
-    def add_debug(self, banner):
-        last_loop = Signal(32)
-        data_error_msg = " Data Error @ 0x\%0{}x: 0x\%0{}x vs 0x\%0{}x".format(
-            self.adr_width//4, self.dw//4, self.dw//4)
-        self.sync += [
-            If(self.data_error,
-                Display(banner + data_error_msg,
-                    self.base_addr,
-                    self.bus.r.data,
-                    self.recv_data,
-                )
-            ),
-            timeline(self.data_error, [
-                (128, [Finish()])
-            ])
-        ]
+    def add_debug(self, banner, finish_delay=1):
+        add_data_error_debug(self, banner, self.base_addr, self.bus.r.data, finish_delay)
+
+# Bus standard: (RAM class, Interface class, addressing).
+_RAM_TABLE = {
+    "wishbone": (wishbone.SRAM,   wishbone.Interface,   "word"),
+    "axi-lite": (axi.AXILiteSRAM, axi.AXILiteInterface, "byte"),
+}
 
 def add_ram(soc, name, bus_standard, origin, size, contents=[], mode="rwx"):
-    print(bus_standard)
-    ram_cls = {
-        "wishbone": wishbone.SRAM,
-        "axi-lite": axi.AXILiteSRAM,
-    }[bus_standard]
-    interface_cls = {
-        "wishbone": wishbone.Interface,
-        "axi-lite": axi.AXILiteInterface,
-    }[soc.bus.standard]
-    addressing = {
-        "axi-lite": "byte",
-        "wishbone": "word",
-    }[bus_standard]
+    ram_cls, _, addressing = _RAM_TABLE[bus_standard]
+    _, interface_cls, _    = _RAM_TABLE[soc.bus.standard]
     ram_bus = interface_cls(
         data_width    = soc.bus.data_width,
         address_width = soc.bus.address_width,
         bursting      = soc.bus.bursting,
         addressing    = addressing,
     )
-    ram = ram_cls(size, bus=ram_bus, init=contents, read_only=("w" not in mode), name=name)
-    soc.bus.add_slave(name=name, slave=ram.bus, region=SoCRegion(origin=origin, size=size, mode=mode))
-    soc.check_if_exists(name)
-    soc.logger.info("RAM {} {} {}.".format(
-        colorer(name),
-        colorer("added", color="green"),
-        soc.bus.regions[name]))
-    soc.add_module(name=name, module=ram)
+    ram    = ram_cls(size, bus=ram_bus, init=contents, read_only=("w" not in mode), name=name)
+    region = SoCRegion(origin=origin, size=size, mode=mode)
+    soc.bus.add_slave(name=name, slave=ram.bus, region=region)
+    soc.add_module(name=name, module=ram) # Raises on duplicate name.
+    if soc.logger.isEnabledFor(logging.INFO):
+        soc.logger.info("RAM {} {} {}.".format(
+            colorer(name),
+            colorer("added", color="green"),
+            region))
     if contents != []:
-        self.add_config(f"{name}_INIT", 1)
+        soc.add_config(f"{name}_INIT", 1)
+
 # IOs ----------------------------------------------------------------------------------------------
 
 _io = [
@@ -236,15 +328,14 @@ class Platform(SimPlatform):
 # SimSoC -------------------------------------------------------------------------------------------
 
 class SimSoC(SoCMini):
-    def __init__(self, default_trace=1, endpoint_bus_std="axi-lite"):
+    def __init__(self, default_trace=0, endpoint_bus_std="axi", trace_start=0, trace_end=-1, error_finish_delay=1):
         # Parameters.
-        assert endpoint_bus_std in ["axi-lite", "wishbone"]
+        assert endpoint_bus_std in ["axi", "wishbone"]
 
         sys_clk_freq = int(1e6)
 
         # Platform.
         platform = Platform()
-        self.comb += platform.trace.eq(1)
 
         # CRG --------------------------------------------------------------------------------------
         self.crg = CRG(platform.request("sys_clk"))
@@ -254,92 +345,219 @@ class SimSoC(SoCMini):
 
         # SRAMs.
         # ------
-        add_ram(self, "myram0", "axi-lite",
-            origin = 0x4_0000_0000,
-            size   = 0x100,
-        )
-        add_ram(self, "myram1", "axi-lite",
-            origin = 0x0_0002_0000,
-            size   = 0x100,
-        )
-
-        if endpoint_bus_std == "axi-lite":
+        for name, origin, size, mode in [
+            # Name    Origin         Size   Mode
+            ("myram0", 0x4_0000_0000, 0x100, "rwx"),
+            ("myram1", 0x0_0002_0000, 0x100, "rwx"),
+        ]:
+            add_ram(self, name, "axi-lite", origin, size, mode=mode)
+
+        if endpoint_bus_std == "axi":
             addressing = "byte"
             # AXI Packet writer.
             # -----------------------
-            self.pkt_stream_h = AXIPacketStreamer(addressing, 0x400000000, 0x12345678, 32, 64, 0x100)
-            self.pkt_stream_l = AXIPacketStreamer(addressing, 0x2_0000, 0xCAFEBEBE, 32, 64, 0x100)
+            self.pkt_stream = AXIPacketStreamer(addressing, 0x400000000, 0x12345678, 32, 64, 0x100)
 
             # AXI Packet checker.
             # -----------------------
-            self.pkt_check_h  = AXIPacketChecker(addressing, 0x400000000, 0x12345678, 32, 64, 0x100)
-            self.pkt_check_l  = AXIPacketChecker(addressing, 0x2_0000, 0xCAFEBEBE, 32, 64, 0x100)
+            self.pkt_check  = AXIPacketChecker(addressing, 0x400000000, 0x12345678, 32, 64, 0x100)
+
+            endpoint_bus = axi.AXIInterface(
+                data_width    = 32,
+                address_width = 64,
+                addressing    = addressing,
+                id_width      = 1)
+            endpoint_beat = endpoint_bus.w.valid & endpoint_bus.w.ready
         else:
             addressing = "word"
             # Wishbone Packet writer.
             # -----------------------
-            self.pkt_stream_h = WishbonePacketStreamer(addressing, 0x400000000, 0x12345678, 32, 64, 0x100)
-            self.pkt_stream_l = WishbonePacketStreamer(addressing, 0x2_0000, 0xCAFEBEBE, 32, 64, 0x100)
+            self.pkt_stream = WishbonePacketStreamerWord(0x400000000, 0x12345678, 32, 64, 0x100)
 
             # Wishbone Packet checker.
             # -----------------------
-            self.pkt_check_h  = WishbonePacketChecker(addressing, 0x400000000, 0x12345678, 32, 64, 0x100)
-            self.pkt_check_l  = WishbonePacketChecker(addressing, 0x2_0000, 0xCAFEBEBE, 32, 64, 0x100)
-
-        self.pkt_check_h.add_debug("[Checker High]")
-        self.pkt_check_l.add_debug("[Checker Low]")
-
-        self.bus.add_master("streamer_high", self.pkt_stream_h.bus)
-        self.bus.add_master("checker_high",  self.pkt_check_h.bus)
-        self.bus.add_master("streamer_low",  self.pkt_stream_l.bus)
-        self.bus.add_master("checker_low",   self.pkt_check_l.bus)
-
-        # Pipeline sequence.
-        # ------------------
-        self.comb += [
-            self.pkt_stream_l.start.eq(self.pkt_stream_h.end),
-            self.pkt_check_h.start.eq(self.pkt_stream_l.end),
-            self.pkt_check_l.start.eq(self.pkt_check_h.end),
-        ]
+            self.pkt_check  = WishbonePacketCheckerWord(0x400000000, 0x12345678, 32, 64, 0x100)
+
+            endpoint_bus = wishbone.Interface(
+                data_width    = 32,
+                address_width = 64,
+                addressing    = addressing)
+            endpoint_beat = endpoint_bus.stb & endpoint_bus.cyc & endpoint_bus.we & endpoint_bus.ack
+
+        self.pkt_check.add_debug("[Checker]", finish_delay=error_finish_delay)
+        if endpoint_bus_std == "axi":
+            platform.add_source(SimBeatLog.source)
+
+        # Endpoint bus.
+        # -------------
+        # Streamer/Checker run one after the other: share a single SoC master (no arbitration)
+        # and route it to the active one.
+        check_sel = Signal()
+        self.comb += Case(check_sel, {
+            0 : self.pkt_stream.bus.connect(endpoint_bus),
+            1 : self.pkt_check.bus.connect(endpoint_bus),
+        })
+        self.bus.add_master("endpoint", endpoint_bus)
 
         # FSM.
         # ----
+        # One state per phase: start is held until the phase's end, the next phase's window/seed
+        # being reloaded on that same cycle so the next run starts without idle cycles.
+        phases = [
+            # Name       Module           Window         Seed
+            ("STREAM_H", self.pkt_stream, 0x4_0000_0000, 0x12345678),
+            ("STREAM_L", self.pkt_stream, 0x0_0002_0000, 0xCAFEBEBE),
+            ("CHECK_H",  self.pkt_check,  0x4_0000_0000, 0x12345678),
+            ("CHECK_L",  self.pkt_check,  0x0_0002_0000, 0xCAFEBEBE),
+        ]
+
+        def reload(adr, val):
+            return [
+                self.pkt_stream.reload.eq(1),
+                self.pkt_stream.reload_adr.eq(adr),
+                self.pkt_stream.reload_val.eq(val),
+                self.pkt_check.reload.eq(1),
+                self.pkt_check.reload_adr.eq(adr),
+                self.pkt_check.reload_val.eq(val),
+            ]
+
         self.fsm = fsm = FSM(reset_state="RESET")
         fsm.act("RESET",
-            self.pkt_stream_h.start.eq(1),
-            NextState("WAIT-END-CHECK"),
-        ),
-        fsm.act("WAIT-END-CHECK",
-            If(self.pkt_check_l.end,
-               Finish()
+            *reload(*phases[0][2:]),
+            NextState(phases[0][0]),
+        )
+        for i, (name, module, _, _) in enumerate(phases):
+            next_phase = phases[i + 1] if (i + 1) < len(phases) else None
+            fsm.act(name,
+                module.start.eq(1),
+                If(module.end,
+                    *(reload(*next_phase[2:]) if next_phase is not None else []),
+                    NextState("DONE" if next_phase is None else next_phase[0]),
+                )
             )
+        fsm.act("DONE",
+            Finish(),
         )
-
-        self.sync += If(self.pkt_check_l.end, Finish())
+        self.comb += check_sel.eq(fsm.ongoing("CHECK_H") | fsm.ongoing("CHECK_L"))
 
         # Debug ------------------------------------------------------------------------------------
 
-        platform.add_debug(self, reset=default_trace)
+        # Start dumping on the first streamer write beat (or from reset with default_trace=1) and only
+        # dump the [trace_start, trace_end[ cycles window (trace_end=-1: until the end).
+        trace_armed  = Signal(reset=default_trace)
+        cycle_cnt    = Signal(32)
+        trace_window = (cycle_cnt >= trace_start)
+        if trace_end >= 0:
+            trace_window = trace_window & (cycle_cnt < trace_end)
+        self.sync += [
+            If(endpoint_beat, trace_armed.eq(1)),
+            cycle_cnt.eq(cycle_cnt + 1),
+        ]
+        self.comb += platform.trace.eq((trace_armed | endpoint_beat) & trace_window)
+
+# Simulation Binary Cache --------------------------------------------------------------------------
+
+_SIM_CACHE_DIR      = os.path.expanduser("~/.cache/litex_verilator")
+_SIM_CACHE_DIRS     = ["obj_dir", "modules"] # Compiled simulation and its modules (.so).
+_LITEX_SIM_CORE_DIR = os.path.join(os.path.dirname(os.path.abspath(litex_sim.__file__)), "core")
+
+def _sim_cache_key(gateware_dir, build_kwargs, extra_files=[]):
+    """Hash the generated simulation sources/build script, extra_files, the LiteX simulation core
+    (Makefiles and C/C++ sources) and the build options."""
+    h = hashlib.sha256(repr(sorted(build_kwargs.items())).encode())
+    h.update(os.environ.get("CFLAGS", "").encode())
+    # (name, path) of the hashed files.
+    files = [(f, os.path.join(gateware_dir, f)) for f in sorted(os.listdir(gateware_dir))
+        if f.endswith((".v", ".init", ".h", ".cpp", ".mak")) or f.startswith("build_")]
+    files += [(os.path.basename(f), f) for f in sorted(extra_files)]
+    for root, dirs, names in os.walk(_LITEX_SIM_CORE_DIR):
+        dirs.sort()
+        files += [(os.path.relpath(os.path.join(root, f), _LITEX_SIM_CORE_DIR), os.path.join(root, f))
+            for f in sorted(names) if f.endswith((".c", ".cpp", ".h", ".mak")) or f == "Makefile"]
+    for name, f in files:
+        h.update(name.encode())
+        with open(f, "rb") as fd:
+            for line in fd:
+                # Skip // comments: generated headers are timestamped.
+                if not line.lstrip().startswith(b"//"):
+                    h.update(line)
+    return h.hexdigest()
+
+def _run_sim_binary(gateware_dir):
+    """Run obj_dir/Vsim from gateware_dir (as LiteX's _run_sim: restore the terminal settings after
+    the run), raise on a non-zero exit code."""
+    termios_settings = None
+    if sys.platform != "win32" and sys.stdin.isatty():
+        import termios
+        termios_settings = termios.tcgetattr(sys.stdin.fileno())
+    try:
+        r = subprocess.call([os.path.join("obj_dir", "Vsim")], cwd=gateware_dir)
+    finally:
+        if termios_settings is not None:
+            termios.tcsetattr(sys.stdin.fileno(), termios.TCSAFLUSH, termios_settings)
+    if r != 0:
+        raise OSError("Simulation failed with {}".format(r))
+
+def build_and_run_cached(builder, sim_config, build_kwargs, cache_dir=_SIM_CACHE_DIR):
+    """Generate the simulation, then run the cached Verilator build (obj_dir and modules) when the
+    sources are unchanged or compile/run it and fill the cache."""
+    builder.build(sim_config=sim_config, **build_kwargs, run=0)
+    sources = [f for f, *_ in builder.soc.platform.sources
+        if os.path.dirname(f) != os.path.abspath(builder.gateware_dir)]
+    cached  = os.path.join(cache_dir, _sim_cache_key(builder.gateware_dir, build_kwargs, sources))
+    if all(os.path.isdir(os.path.join(cached, d)) for d in _SIM_CACHE_DIRS):
+        builder.soc.logger.info("Using cached simulation build {}.".format(cached))
+        for d in _SIM_CACHE_DIRS:
+            shutil.copytree(os.path.join(cached, d), os.path.join(builder.gateware_dir, d),
+                symlinks=True, dirs_exist_ok=True)
+        _run_sim_binary(builder.gateware_dir)
+    else:
+        builder.build(sim_config=sim_config, **build_kwargs, build=False, run=1)
+        # Fill a temporary directory first so an interrupted copy is never used as a cache entry.
+        tmp = "{}.{}.tmp".format(cached, os.getpid())
+        for d in _SIM_CACHE_DIRS:
+            shutil.copytree(os.path.join(builder.gateware_dir, d), os.path.join(tmp, d), symlinks=True)
+        try:
+            shutil.rmtree(cached, ignore_errors=True) # Incomplete entry.
+            os.rename(tmp, cached)
+        except OSError: # Already filled by another run.
+            shutil.rmtree(tmp, ignore_errors=True)
 
 def main():
     parser = argparse.ArgumentParser(description="Verilator test for 64bits addressing")
-    parser.add_argument("--endpoint-bus-std", default="axi_lite", help="Select generators/checker bus format: wishbone, axi-lite. (default: axi-lite)")
+    parser.add_argument("--endpoint-bus-std",  default="axi", help="Select generators/checker bus format: wishbone, axi. (default: axi)")
+    parser.add_argument("--trace-start-cycle", default="0",   help="First sys_clk cycle dumped when tracing.")
+    parser.add_argument("--trace-end-cycle",   default="-1",  help="First sys_clk cycle no longer dumped when tracing (exclusive bound, -1: until the end).")
+    parser.add_argument("--march-native",      action="store_true", help="Compile the simulation for the host CPU (-march=native).")
+    parser.add_argument("--no-sim-cache",      action="store_true", help="Always recompile the simulation (no cached binary).")
     verilator_build_args(parser)
+    parser.set_defaults(
+        trace_fst = True,
+        threads   = max(1, (os.cpu_count() or 1)//2),
+    )
     args = parser.parse_args()
+    # Picked up by the simulation Makefile (CFLAGS += ...).
+    if args.march_native:
+        os.environ["CFLAGS"] = " ".join(filter(None, [os.environ.get("CFLAGS"), "-march=native"]))
     verilator_build_kwargs = verilator_build_argdict(args)
     sim_config = SimConfig(default_clk="sys_clk")
 
     # Create SoC.
     soc = SimSoC(
-        endpoint_bus_std  = args.endpoint_bus_std
+        endpoint_bus_std  = args.endpoint_bus_std,
+        trace_start       = int(args.trace_start_cycle, 0),
+        trace_end         = int(args.trace_end_cycle, 0),
     )
     builder = Builder(soc)
-    builder.build(sim_config=sim_config, **verilator_build_kwargs, run=1)
+    if args.no_sim_cache:
+        builder.build(sim_config=sim_config, **verilator_build_kwargs, run=1)
+    else:
+        build_and_run_cached(builder, sim_config, verilator_build_kwargs)
 
 if __name__ == "__main__":
     main()
 
 # limitation:
-# - addressing must be "byte" for everything in a axi-lite full chain
+# - addressing must be "byte" for everything in a axi/axi-lite full chain
 # - when streamer/checker are wishbone this part must be "word" (rest remains "byte)
 # - wishbone.SRAM can't be used ("word" only but Interface is "byte" only)
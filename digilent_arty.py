@@ -15,7 +15,6 @@ from litex.gen import *
 from litex_boards.platforms import digilent_arty
 
 from litex.soc.cores.clock import *
-from litex.soc.integration.soc import SoCRegion
 from litex.soc.integration.soc_core import *
 from litex.soc.integration.soc import *
 from litex.soc.integration.builder import *
@@ -24,6 +23,8 @@ from litex.soc.cores.led import LedChaser
 from litedram.modules import MT41K128M16
 from litedram.phy import s7ddrphy
 
+from utils import add_sdram_region
+
 # CRG ----------------------------------------------------------------------------------------------
 
 class _CRG(LiteXModule):
@@ -89,30 +90,9 @@ class BaseSoC(SoCCore):
             )
 
             if sdram_test:
-                from litedram.frontend.wishbone import LiteDRAMWishbone2Native
-                # Request a LiteDRAM native port.
-                port = self.sdram.crossbar.get_port()
-                port.data_width = 2**int(log2(port.data_width)) # Round to nearest power of 2.
-
-                # Add SDRAM region.
-                myram_region = SoCRegion(
+                add_sdram_region(self, "myram",
                     origin = 0x4_0000_0000,
                     size   = 0x40_0000,
-                    mode   = "rwx")
-                self.bus.add_region("myram", myram_region)
-
-                # Create Wishbone Slave.
-                wb_sdram = wishbone.Interface(
-                    data_width    = self.bus.data_width,
-                    address_width = self.bus.address_width,
-                    addressing    = "word")
-                self.bus.add_slave(name="myram", slave=wb_sdram)
-
-                # Wishbone Slave <--> LiteDRAM bridge.
-                self.wishbone_bridge = LiteDRAMWishbone2Native(
-                    wishbone     = wb_sdram,
-                    port         = port,
-                    base_address = self.bus.regions["myram"].origin
                 )
 
         # SRAMs ------------------------------------------------------------------------------------
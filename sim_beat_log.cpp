@@ -0,0 +1,56 @@
+//
+// This file is part of litex_64bit_addressing_test
+//
+// Copyright (c) 2023 Gwenhael Goavec-Merou <gwenhael@enjoy-digital.fr>
+// SPDX-License-Identifier: BSD-2-Clause
+
+// Batched per-beat log for utils.SimBeatLog: beats are stored in a fixed buffer and written to
+// stdout with a single fwrite when the buffer is full and when the simulation exits.
+
+#include <cstdio>
+#include <cstdint>
+#include <string>
+
+namespace {
+
+struct BeatLog {
+    struct Beat {
+        uint64_t adr;
+        uint64_t dat_r;
+        uint64_t expected;
+    };
+
+    static const size_t depth = 4096;
+    Beat   beats[depth];
+    size_t count = 0;
+
+    void flush() {
+        std::string out;
+        char line[80];
+        for (size_t i = 0; i < count; i++) {
+            // Same format as the previous per-beat $display: expected -> received.
+            snprintf(line, sizeof(line), "addr %08llx dat_r %08llx -> %08llx\n",
+                (unsigned long long)beats[i].adr,
+                (unsigned long long)beats[i].expected,
+                (unsigned long long)beats[i].dat_r);
+            out += line;
+        }
+        fwrite(out.data(), 1, out.size(), stdout);
+        fflush(stdout);
+        count = 0;
+    }
+
+    ~BeatLog() {
+        flush();
+    }
+};
+
+BeatLog beat_log;
+
+}
+
+extern "C" void sim_beat_log(unsigned long long adr, unsigned long long dat_r, unsigned long long expected) {
+    beat_log.beats[beat_log.count++] = {adr, dat_r, expected};
+    if (beat_log.count == BeatLog::depth)
+        beat_log.flush();
+}
@@ -27,6 +27,8 @@ from litedram.phy import usddrphy
 from litepcie.phy.usppciephy import USPPCIEPHY
 from litepcie.software import generate_litepcie_software
 
+from utils import add_sdram_region
+
 # CRG ----------------------------------------------------------------------------------------------
 
 class _CRG(LiteXModule):
@@ -90,36 +92,9 @@ class BaseSoC(SoCCore):
             platform.add_platform_command("set_property SEVERITY {{Warning}} [get_drc_checks PDCN-2736]")
 
             if sdram_test:
-                from math import log2
-
-                from litedram.frontend.wishbone import LiteDRAMWishbone2Native
-
-                from litex.soc.integration.soc import SoCRegion
-                from litex.soc.interconnect import wishbone
-
-                # Request a LiteDRAM native port.
-                port = self.sdram.crossbar.get_port()
-                port.data_width = 2**int(log2(port.data_width)) # Round to nearest power of 2.
-
-                # Add SDRAM region.
-                myram_region = SoCRegion(
+                add_sdram_region(self, "myram",
                     origin = 0x1_0000_00000,
                     size   = 0x8_0000_0000,
-                    mode   = "rwx")
-                self.bus.add_region("myram", myram_region)
-
-                # Create Wishbone Slave.
-                wb_sdram = wishbone.Interface(
-                    data_width    = self.bus.data_width,
-                    address_width = self.bus.address_width,
-                    addressing    = "word")
-                self.bus.add_slave(name="myram", slave=wb_sdram)
-
-                # Wishbone Slave <--> LiteDRAM bridge.
-                self.wishbone_bridge = LiteDRAMWishbone2Native(
-                    wishbone     = wb_sdram,
-                    port         = port,
-                    base_address = self.bus.regions["myram"].origin
                 )
 
         # PCIe -------------------------------------------------------------------------------------
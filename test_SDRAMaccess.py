@@ -8,72 +8,83 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 import sys
+import array
 import time
+import struct
 import argparse
 
 from litex import RemoteClient
 
-# Identifier Test ----------------------------------------------------------------------------------
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-def ident_test(port):
-    wb = RemoteClient(port=port)
-    wb.open()
+# Utils --------------------------------------------------------------------------------------------
 
-    fpga_identifier = ""
+ETHERBONE_MAX_BURST = 255 # Etherbone record count is 8-bit.
 
-    for i in range(256):
-        c = chr(wb.read(wb.bases.identifier_mem + 4*i) & 0xff)
-        fpga_identifier += c
-        if c == "\0":
-            break
+def burst_read(wb, base, length):
+    """Read length 32-bit words at base, in bursts of at most ETHERBONE_MAX_BURST words."""
+    read  = wb.read
+    datas = array.array("I")
+    for i in range(0, length, ETHERBONE_MAX_BURST):
+        datas.extend(read(base + 4*i, min(ETHERBONE_MAX_BURST, length - i), burst="incr"))
+    return datas
 
-    print(fpga_identifier)
+def burst_write(wb, base, datas):
+    """Write the 32-bit words of datas at base, in bursts of at most ETHERBONE_MAX_BURST words."""
+    write = wb.write
+    for i in range(0, len(datas), ETHERBONE_MAX_BURST):
+        write(base + 4*i, datas[i:i + ETHERBONE_MAX_BURST])
 
-    wb.close()
+def counter_mismatches(datas, seed):
+    """Return the indexes of datas not matching the seed + index 32-bit counter."""
+    if np is not None:
+        expected = ((np.arange(len(datas), dtype=np.uint64) + seed) & 0xffffffff).astype(np.uint32)
+        return np.flatnonzero(np.asarray(datas, dtype=np.uint32) != expected).tolist()
+    return [i for i, data in enumerate(datas) if data != ((seed + i) & 0xffffffff)]
 
-# SRAM Test ----------------------------------------------------------------------------------------
+# Identifier Test ----------------------------------------------------------------------------------
 
-def sram_test(port, offset, seed):
-    wb = RemoteClient(port=port)
-    wb.open()
+def ident_test(wb):
+    # One character per 32-bit word, NULL terminated.
+    fpga_identifier = bytes(data & 0xff for data in burst_read(wb, wb.bases.identifier_mem, 256))
+    end = fpga_identifier.find(b"\0")
+
+    print(fpga_identifier[:end if end >= 0 else None].decode("ascii", "replace"))
+
+# SRAM Test ----------------------------------------------------------------------------------------
 
+def sram_test(wb, offset, seed):
     base_addr = wb.mems.myram.base + offset
 
     def mem_read(base, length):
-        data = []
-        for addr in range(base, base + length, 4):
-            data.append(wb.read(addr))
-        return data
+        return burst_read(wb, base, length//4)
 
-    def mem_dump(base, length):
-        for addr in range(base, base + length, 4):
+    def mem_format(base, datas):
+        lines = []
+        for n, data in enumerate(datas):
+            addr = base + 4*n
             if (addr%16 == 0):
-                if addr != base:
-                    print("")
-                print("0x{:08x}".format(addr), end="  ")
-            data = wb.read(addr)
-            for i in reversed(range(4)):
-                print("{:02x}".format((data >> (8*i)) & 0xff), end=" ")
-        print("")
+                lines.append(["0x{:08x} ".format(addr)])
+            elif not lines:
+                lines.append([])
+            lines[-1].append(struct.pack(">I", data).hex(" "))
+        return "\n".join(" ".join(line) for line in lines) + "\n"
+
+    def mem_dump(base, length):
+        sys.stdout.write(mem_format(base, mem_read(base, length)))
 
     def mem_write(base, datas):
-        print(len(datas))
-        for n, addr in enumerate(range(base, base + len(datas), 4)):
-            if (addr%16 == 0):
-                if addr != base:
-                    print("")
-                print("0x{:08x}".format(addr), end="  ")
-                print("0x{:08x}".format(addr//4), end="  ")
-            data = datas[n]
-            for i in reversed(range(4)):
-                print("{:02x}".format((data >> (8*i)) & 0xff), end=" ")
-            wb.write(addr, data)
-        print("")
+        burst_write(wb, base, datas)
     
     size = 0x100
 
     print(f"Fill SDRAM (addr {base_addr:08x} with counter:")
-    mem_write(base_addr, [i+seed for i in range(0x100)])
+    datas = [(i + seed) & 0xffffffff for i in range(size//4)]
+    mem_write(base_addr, datas)
+    sys.stdout.write(mem_format(base_addr, datas))
     print("")
 
     mem_dump(base_addr, size)
@@ -81,30 +92,24 @@ def sram_test(port, offset, seed):
     ram0 = mem_read(base_addr, size)
     #ram1 = mem_read(wb.mems.myram1.base, wb.mems.myram1.size)
 
-    for i in range(size//4):
-        if ram0[i] != seed + i:
-            print(f"Error read {ram0[i]:08x}@{base_addr+(4*i):08x} vs {seed + i:08x}")
-            return False
+    mismatches = counter_mismatches(ram0, seed)
+    for i in mismatches[:8]:
+        print(f"Error read {ram0[i]:08x}@{base_addr+(4*i):08x} vs {(seed + i) & 0xffffffff:08x}")
+    if mismatches:
+        return False
     print("ok")
-
-    wb.close()
     return True
 
 # Write then Read ------------------------------------------------------------------------------------
 
-def wr_rd(port, offset, value):
-    wb = RemoteClient(port=port)
-    wb.open()
-
+def wr_rd(wb, offset, value):
     base_addr = wb.mems.myram.base + offset
 
-    wb.write(base_addr, value)
-    data = wb.read(base_addr)
+    burst_write(wb, base_addr, [value])
+    data = burst_read(wb, base_addr, 1)[0]
 
     print(f"SDRAM access @0x{base_addr:08x} write: 0x{value:08x} read: 0x{data:08x}")
 
-    wb.close()
-
 # Run ----------------------------------------------------------------------------------------------
 
 def main():
@@ -121,15 +126,20 @@ def main():
     offset = int(args.offset, 0)
     seed   = int(args.seed, 0)
 
-    if args.ident:
-        ident_test(port=port)
-
-    if args.sram:
-        if not sram_test(port=port, offset=offset, seed=seed):
-            return
-
-    if args.wr_rd:
-        wr_rd(port=port, offset=offset, value=seed)
+    wb = RemoteClient(port=port)
+    wb.open()
+    try:
+        if args.ident:
+            ident_test(wb)
+
+        if args.sram:
+            if not sram_test(wb, offset=offset, seed=seed):
+                return
+
+        if args.wr_rd:
+            wr_rd(wb, offset=offset, value=seed)
+    finally:
+        wb.close()
 
 if __name__ == "__main__":
     main()
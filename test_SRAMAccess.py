@@ -8,123 +8,149 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 import sys
+import array
 import time
+import struct
 import argparse
 
 from litex import RemoteClient
 
-# Identifier Test ----------------------------------------------------------------------------------
-
-def ident_test(port):
-    wb = RemoteClient(port=port)
-    wb.open()
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Utils --------------------------------------------------------------------------------------------
+
+ETHERBONE_MAX_BURST = 255 # Etherbone record count is 8-bit.
+
+def burst_read(wb, base, length):
+    """Read length 32-bit words at base, in bursts of at most ETHERBONE_MAX_BURST words."""
+    read  = wb.read
+    datas = array.array("I")
+    for i in range(0, length, ETHERBONE_MAX_BURST):
+        datas.extend(read(base + 4*i, min(ETHERBONE_MAX_BURST, length - i), burst="incr"))
+    return datas
+
+def burst_write(wb, base, datas):
+    """Write the 32-bit words of datas at base, in bursts of at most ETHERBONE_MAX_BURST words."""
+    write = wb.write
+    for i in range(0, len(datas), ETHERBONE_MAX_BURST):
+        write(base + 4*i, datas[i:i + ETHERBONE_MAX_BURST])
+
+def counter_mismatches(datas, seed):
+    """Return the indexes of datas not matching the seed + index 32-bit counter."""
+    if np is not None:
+        expected = ((np.arange(len(datas), dtype=np.uint64) + seed) & 0xffffffff).astype(np.uint32)
+        return np.flatnonzero(np.asarray(datas, dtype=np.uint32) != expected).tolist()
+    return [i for i, data in enumerate(datas) if data != ((seed + i) & 0xffffffff)]
+
+def value_mismatches(datas, words, values):
+    """Return the indexes i of words where datas[words[i]] does not match values[i]."""
+    if np is not None:
+        return np.flatnonzero(np.asarray(datas, dtype=np.uint32)[words] != np.asarray(values, dtype=np.uint32)).tolist()
+    return [i for i, (word, value) in enumerate(zip(words, values)) if datas[word] != value]
 
-    fpga_identifier = ""
-
-    for i in range(256):
-        c = chr(wb.read(wb.bases.identifier_mem + 4*i) & 0xff)
-        fpga_identifier += c
-        if c == "\0":
-            break
+# Identifier Test ----------------------------------------------------------------------------------
 
-    print(fpga_identifier)
+def ident_test(wb):
+    # One character per 32-bit word, NULL terminated.
+    fpga_identifier = bytes(data & 0xff for data in burst_read(wb, wb.bases.identifier_mem, 256))
+    end = fpga_identifier.find(b"\0")
 
-    wb.close()
+    print(fpga_identifier[:end if end >= 0 else None].decode("ascii", "replace"))
 
 # SRAM Test ----------------------------------------------------------------------------------------
 
-def sram_test(port):
-    wb = RemoteClient(port=port)
-    wb.open()
-
+def sram_test(wb):
     def mem_read(base, length):
-        data = []
-        for addr in range(base, base + length, 4):
-            data.append(wb.read(addr))
-        return data
+        return burst_read(wb, base, length//4)
 
-    def mem_dump(base, length):
-        for addr in range(base, base + length, 4):
+    def mem_format(base, datas):
+        lines = []
+        for n, data in enumerate(datas):
+            addr = base + 4*n
             if (addr%16 == 0):
-                if addr != base:
-                    print("")
-                print("0x{:08x}".format(addr), end="  ")
-            data = wb.read(addr)
-            for i in reversed(range(4)):
-                print("{:02x}".format((data >> (8*i)) & 0xff), end=" ")
-        print("")
+                lines.append(["0x{:08x} ".format(addr)])
+            elif not lines:
+                lines.append([])
+            lines[-1].append(struct.pack(">I", data).hex(" "))
+        return "\n".join(" ".join(line) for line in lines) + "\n"
 
     def mem_write(base, datas):
-        print(len(datas))
-        for n, addr in enumerate(range(base, base + len(datas), 4)):
-            if (addr%16 == 0):
-                if addr != base:
-                    print("")
-                print("0x{:08x}".format(addr), end="  ")
-                print("0x{:08x}".format(addr//4), end="  ")
-            data = datas[n]
-            for i in reversed(range(4)):
-                print("{:02x}".format((data >> (8*i)) & 0xff), end=" ")
-            wb.write(addr, data)
-        print("")
+        burst_write(wb, base, datas)
 
     print(f"Fill First RAM (addr {wb.mems.myram0.base:08x} with counter:")
-    mem_write(wb.mems.myram0.base, [i+0xCAFEBEBE for i in range(0x100)])
+    datas = [(i + 0xCAFEBEBE) & 0xffffffff for i in range(wb.mems.myram0.size//4)]
+    mem_write(wb.mems.myram0.base, datas)
+    sys.stdout.write(mem_format(wb.mems.myram0.base, datas))
     print("")
 
     print(f"Fill Second RAM (addr {wb.mems.myram1.base:08x} with counter:")
-    mem_write(wb.mems.myram1.base, [i+0x12345678 for i in range(0x100)])
-
-    mem_dump(wb.mems.myram0.base, wb.mems.myram0.size)
-    mem_dump(wb.mems.myram1.base, wb.mems.myram1.size)
+    datas = [(i + 0x12345678) & 0xffffffff for i in range(wb.mems.myram1.size//4)]
+    mem_write(wb.mems.myram1.base, datas)
+    sys.stdout.write(mem_format(wb.mems.myram1.base, datas))
 
     ram0 = mem_read(wb.mems.myram0.base, wb.mems.myram0.size)
     ram1 = mem_read(wb.mems.myram1.base, wb.mems.myram1.size)
 
-    for i in range(0x100//4):
-        if ram0[i] != 0xcafebebe + i or ram1[i] != 0x12345678+i:
-            print(f"Error read {ram0[i]:08x}@{wb.mems.myram0.base+(4*i):08x} and", end=' ')
-            print(f"{ram1[i]:08x}@{wb.mems.myram1.base+(4*i):08x} and", end=' ')
-            return False
+    sys.stdout.write(mem_format(wb.mems.myram0.base, ram0))
+    sys.stdout.write(mem_format(wb.mems.myram1.base, ram1))
+
+    errors = False
+    for mem, datas, seed in [(wb.mems.myram0, ram0, 0xcafebebe), (wb.mems.myram1, ram1, 0x12345678)]:
+        mismatches = counter_mismatches(datas, seed)
+        for i in mismatches[:8]:
+            print(f"Error read {datas[i]:08x}@{mem.base+(4*i):08x} vs {(seed + i) & 0xffffffff:08x}")
+        errors |= len(mismatches) > 0
+    if errors:
+        return False
     print("ok")
-
-    wb.close()
     return True
 
 # Access Test ----------------------------------------------------------------------------------------
 
-def access_test(port):
+def access_test(wb):
     import random
-    wb = RemoteClient(port=port)
-    wb.open()
 
     nb_iter   = 256
     mem_size  = wb.mems.myram0.size
     mem0_base = wb.mems.myram0.base
     mem1_base = wb.mems.myram1.base
-
-    for it in range(256):
-        offset = random.randint(0, mem_size-1)
-        data0  = random.randint(1, 2**32-1)
-        data1  = random.randint(1, 2**32-1)
-
+    adr_bits  = (mem_size - 1).bit_length() # No modulo bias when mem_size is a power of 2.
+
+    # Random accesses.
+    accesses = []
+    for it in range(nb_iter):
+        offset = random.getrandbits(adr_bits) % mem_size
+        data0  = random.getrandbits(32) or 1
+        data1  = random.getrandbits(32) or 1
+        accesses.append((offset, data0, data1))
+
+    # Write all accesses.
+    write = wb.write
+    for it, (offset, data0, data1) in enumerate(accesses):
         print(f"{it:3d}/{nb_iter:3d}")
         print("\tWrite RAM0 at 0x{:08x}: 0x{:08x}".format(mem0_base + offset, data0), end=' ')
         print("RAM1 at 0x{:08x}: 0x{:08x}.".format(mem1_base + offset, data1))
-        wb.write(mem0_base + offset, data0)
-        wb.write(mem1_base + offset, data1)
-        rd_dat0 = wb.read(mem0_base + offset)
-        rd_dat1 = wb.read(mem1_base + offset)
-        print("\tRead  RAM0 at 0x{:08x}: 0x{:08x}".format(mem0_base + offset, rd_dat0), end=' ')
-        print("RAM1 at 0x{:08x}: 0x{:08x}.".format(mem1_base + offset, rd_dat1))
-        if data0 != rd_dat0:
-            print(f"RAM0 error: mismatch between write and read: 0x{data0:08x} -> 0x{rd_dat0:08x}")
-            return False
-        if data1 != rd_dat1:
-            print(f"RAM1 error: mismatch between write and read: 0x{data1:08x} -> 0x{rd_dat1:08x}")
+        write(mem0_base + offset, data0)
+        write(mem1_base + offset, data1)
+
+    # Burst read back each RAM and check the last value written to each accessed word.
+    for n, (name, base) in enumerate([("RAM0", mem0_base), ("RAM1", mem1_base)]):
+        expected = {}
+        for access in accesses:
+            expected[access[0]//4] = access[1 + n]
+        words  = list(expected.keys())
+        values = list(expected.values())
+        datas  = burst_read(wb, base, mem_size//4)
+        mismatches = value_mismatches(datas, words, values)
+        for i in mismatches[:8]:
+            print(f"{name} error: mismatch between write and read @ 0x{base + 4*words[i]:08x}: 0x{values[i]:08x} -> 0x{datas[words[i]]:08x}")
+        if mismatches:
             return False
-
-    wb.close()
+    print("ok")
+    return True
 
 # Run ----------------------------------------------------------------------------------------------
 
@@ -138,15 +164,20 @@ def main():
 
     port = int(args.port, 0)
 
-    if args.ident:
-        ident_test(port=port)
-
-    if args.sram:
-        if not sram_test(port=port):
-            return
-
-    if args.access:
-        access_test(port=port)
+    wb = RemoteClient(port=port)
+    wb.open()
+    try:
+        if args.ident:
+            ident_test(wb)
+
+        if args.sram:
+            if not sram_test(wb):
+                return
+
+        if args.access:
+            access_test(wb)
+    finally:
+        wb.close()
 
 if __name__ == "__main__":
     main()
@@ -5,83 +5,184 @@
 # Copyright (c) 2023 Gwenhael Goavec-Merou <gwenhael@enjoy-digital.fr>
 # SPDX-License-Identifier: BSD-2-Clause
 
+import os
 import argparse
 
+from math import log2
+
 from migen import *
 from migen.genlib.misc import timeline
 
+from migen.fhdl.specials import Special
+from migen.fhdl.verilog  import _printexpr as verilog_printexpr
+
 from litex.gen import *
 
+from litex.soc.integration.soc      import SoCRegion
 from litex.soc.interconnect         import wishbone
 
 from litex.soc.interconnect.csr import *
 
+# Constants ----------------------------------------------------------------------------------------
+
+SEL_ALL_32 = Constant(0xF, 4) # All byte lanes of a 32-bit Wishbone bus.
+
+# Simulation Helpers -------------------------------------------------------------------------------
+
+class SimPlusArg(Special):
+    """Drive o high when the simulation is started with +<name> on its command line."""
+    def __init__(self, name, o):
+        Special.__init__(self)
+        self.name = name
+        self.o    = wrap(o)
+
+    def iter_expressions(self):
+        yield self, "o", SPECIAL_OUTPUT
+
+    @staticmethod
+    def emit_verilog(special, ns, add_data_file):
+        o = verilog_printexpr(ns, special.o)[0]
+        r  = "reg {}_plusarg = 1'b0;\n".format(o)
+        r += "initial {}_plusarg = $test$plusargs(\"{}\");\n".format(o, special.name)
+        r += "assign {} = {}_plusarg;\n".format(o, o)
+        return r
+
+class SimBeatLog(Special):
+    """Log (adr, dat_r, expected) on each clk cycle where en is high through the sim_beat_log DPI-C
+    function of sim_beat_log.cpp (to be added to the platform sources), which batches the lines
+    instead of doing one $display per beat."""
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sim_beat_log.cpp")
+
+    def __init__(self, en, adr, dat_r, expected, clk=ClockSignal()):
+        Special.__init__(self)
+        assert isinstance(en, Signal)
+        assert max(len(adr), len(dat_r), len(expected)) <= 64
+        self.clk      = wrap(clk)
+        self.en       = wrap(en)
+        self.adr      = wrap(adr)
+        self.dat_r    = wrap(dat_r)
+        self.expected = wrap(expected)
+
+    def iter_expressions(self):
+        for attr in ["clk", "en", "adr", "dat_r", "expected"]:
+            yield self, attr, SPECIAL_INPUT
+
+    @staticmethod
+    def emit_verilog(special, ns, add_data_file):
+        clk, en, adr, dat_r, expected = [verilog_printexpr(ns, getattr(special, attr))[0]
+            for attr in ["clk", "en", "adr", "dat_r", "expected"]]
+        # One SV alias per instance, all bound to the same C function.
+        r  = "import \"DPI-C\" sim_beat_log = function void {}_beat_log(".format(en)
+        r += "input longint unsigned adr, input longint unsigned dat_r, input longint unsigned expected);\n"
+        r += "always @(posedge {}) if ({}) {}_beat_log({}, {}, {});\n".format(
+            clk, en, en, adr, dat_r, expected)
+        return r
+
+def add_data_error_debug(checker, banner, adr, dat_r, finish_delay=1):
+    """Display the first data error of checker then stop the simulation finish_delay cycles later."""
+    error_latched = Signal()
+    first_error   = Signal()
+    fmt = "{} Data Error @ 0x%0{}x: 0x%0{}x vs 0x%0{}x".format(
+        banner, len(adr)//4, len(dat_r)//4, len(dat_r)//4)
+    checker.comb += first_error.eq(checker.data_error & ~error_latched)
+    checker.sync += [
+        If(first_error,
+            error_latched.eq(1),
+            Display(fmt, adr, dat_r, checker.recv_data),
+        ),
+        # Let the error Display go out, then stop the simulation.
+        timeline(first_error, [
+            (finish_delay, [Finish()])
+        ])
+    ]
+
 # Utils --------------------------------------------------------------------------------------------
 
-class WishbonePacketStreamer(LiteXModule):
-    def __init__(self, addressing="byte", init_adr=0, init_val=0, dw=32, adr_width=64, max_len=0x100):
-        self.bus = bus = wishbone.Interface(dw=32, adr_width=64, addressing=addressing)
+class _WishboneFSMBase:
+    """Addressing of the Wishbone streamer/checker, fixed by their Byte/Word subclasses: bus
+    addresses are byte addresses >> adr_shift."""
+    addressing = None
+    adr_shift  = None
 
-        self.end   = Signal()
-        self.start = Signal()
+    def _new_bus(self):
+        assert self.addressing is not None, "Use the Byte/Word subclasses."
+        return wishbone.Interface(dw=32, adr_width=64, addressing=self.addressing)
+
+    def _adr_params(self, init_adr, max_len):
+        """Return (init_adr, incr_adr, max_len) in bus addressing unit."""
+        return init_adr >> self.adr_shift, 4 >> self.adr_shift, max_len >> self.adr_shift
+
+class WishbonePacketStreamer(_WishboneFSMBase, LiteXModule):
+    def __init__(self, init_adr=0, init_val=0, dw=32, adr_width=64, max_len=0x100):
+        self.bus = bus = self._new_bus()
+
+        self.end        = Signal()
+        self.start      = Signal()
+        self.reload     = Signal()
+        self.reload_adr = Signal(adr_width) # Byte address.
+        self.reload_val = Signal(dw)
 
         # # #
 
         # Parameters.
         # -----------
-        _init_adr = init_adr if addressing == "byte" else init_adr >> 2
-        _incr_adr = 4 if addressing == "byte" else 1
-        _max_len  = max_len if addressing == "byte" else max_len >> 2
+        _init_adr, _incr_adr, _max_len = self._adr_params(init_adr, max_len)
+        _last_beat = _max_len//_incr_adr - 1
 
         # Signals.
         # --------
+        adr_init  = Signal(adr_width, reset=_init_adr)
+        data_init = Signal(dw, reset=init_val)
         base_addr = Signal(adr_width)
         sent_data = Signal(dw)
-        delay     = Signal(10)
+        beat_cnt  = Signal(max=_last_beat + 1)
+
+        # Reload.
+        # -------
+        self.sync += If(self.reload,
+            adr_init.eq(self.reload_adr[self.adr_shift:]),
+            data_init.eq(self.reload_val),
+        )
 
         # FSM.
         # ----
         self.fsm = fsm = FSM(reset_state="IDLE")
         fsm.act("IDLE",
-            NextValue(base_addr, _init_adr),
-            NextValue(sent_data, init_val),
-            NextValue(delay, 0),
+            NextValue(base_addr, adr_init),
+            NextValue(sent_data, data_init),
+            NextValue(beat_cnt, 0),
             If(self.start,
                 NextState("WR_DAT"),
             )
         ),
         fsm.act("WR_DAT",
-            NextValue(bus.dat_w, sent_data),
             bus.adr.eq(base_addr),
+            bus.dat_w.eq(sent_data),
             bus.stb.eq(1),
             bus.we.eq(1),
             bus.cyc.eq(1),
-            bus.sel.eq(2**(32//8) - 1),
+            bus.sel.eq(SEL_ALL_32),
+            # Move to the next address/data on ack, stb/cyc remaining asserted.
             If(bus.ack,
-                NextState("WAIT_DELAY"),
-            )
-        ),
-        fsm.act("WAIT_DELAY",
-            NextValue(delay, delay + 1),
-            If(delay == 10,
-                NextValue(delay, 0),
                 NextValue(base_addr, base_addr + _incr_adr),
                 NextValue(sent_data, sent_data + 1),
-                If(_init_adr + _max_len - _incr_adr == base_addr,
+                NextValue(beat_cnt, beat_cnt + 1),
+                If(beat_cnt == _last_beat,
                     self.end.eq(1),
                     NextState("IDLE"),
-                ).Else(
-                    NextState("WR_DAT"),
                 )
             )
         )
 
-class WishbonePacketChecker(LiteXModule):
-    def __init__(self, addressing="byte", init_adr=0, init_val=0, dw=32, adr_width=64, max_len=0x100):
-        self.bus = bus = wishbone.Interface(dw=32, adr_width=64, addressing=addressing)
+class WishbonePacketChecker(_WishboneFSMBase, LiteXModule):
+    def __init__(self, init_adr=0, init_val=0, dw=32, adr_width=64, max_len=0x100, verbose=False):
+        self.bus = bus = self._new_bus()
 
-        self.end   = Signal()
-        self.start = Signal()
+        self.end        = Signal()
+        self.start      = Signal()
+        self.reload     = Signal()
+        self.reload_adr = Signal(adr_width) # Byte address.
+        self.reload_val = Signal(dw)
 
         # # #
 
@@ -89,72 +190,118 @@ class WishbonePacketChecker(LiteXModule):
         # -----------
         self.dw        = dw
         self.adr_width = adr_width
-        _init_adr      = init_adr if addressing == "byte" else init_adr >> 2
-        _incr_adr      = 4 if addressing == "byte" else 1
-        _max_len       = max_len if addressing == "byte" else max_len >> 2
+        _init_adr, _incr_adr, _max_len = self._adr_params(init_adr, max_len)
+        _last_beat     = _max_len//_incr_adr - 1
 
         # Signals.
         # --------
         self.data_error = Signal()
+        adr_init        = Signal(adr_width, reset=_init_adr)
+        data_init       = Signal(dw, reset=init_val)
         base_addr       = Signal(adr_width)
         self.recv_data  = Signal(dw)
+        beat_cnt        = Signal(max=_last_beat + 1)
+        busy            = Signal()
 
-        # FSM.
-        # ----
-        self.fsm = fsm = FSM(reset_state="IDLE")
-        fsm.act("IDLE",
-            NextValue(base_addr, _init_adr),
-            NextValue(self.recv_data, init_val),
-            If(self.start,
-                NextState("RD_DAT"),
-            )
-        ),
-        fsm.act("RD_DAT",
+        # Reload.
+        # -------
+        self.sync += If(self.reload,
+            adr_init.eq(self.reload_adr[self.adr_shift:]),
+            data_init.eq(self.reload_val),
+        )
+
+        # Reads (no FSM: stb/cyc asserted while busy, next address on each ack).
+        # --------------------------------------------------------------------
+        self.comb += [
             bus.adr.eq(base_addr),
-            bus.stb.eq(1),
+            bus.stb.eq(busy),
             bus.we.eq(0),
-            bus.cyc.eq(1),
-            bus.sel.eq(2**(32//8) - 1),
-            If(bus.ack,
+            bus.cyc.eq(busy),
+            bus.sel.eq(SEL_ALL_32),
+            If(busy & bus.ack,
                 If(bus.dat_r != self.recv_data,
                     self.data_error.eq(1),
                 ),
-                NextState("WAIT_RD_ACK"),
-            )
-        ),
-        fsm.act("WAIT_RD_ACK",
-            NextValue(base_addr, base_addr + _incr_adr),
-            NextValue(self.recv_data, self.recv_data + 1),
-
-            If(_init_adr + _max_len - _incr_adr == base_addr,
-               self.end.eq(1),
-                NextState("IDLE"),
-            ).Else(
-                NextState("RD_DAT"),
+                If(beat_cnt == _last_beat,
+                    self.end.eq(1),
+                )
             )
-        )
-
+        ]
         self.sync += [
-            If(bus.stb & bus.cyc & ~bus.we & bus.ack,
-                Display("addr %08x %08x dat_r %08x -> %08x", base_addr, bus.adr, self.recv_data, bus.dat_r),
+            If(~busy,
+                base_addr.eq(adr_init),
+                self.recv_data.eq(data_init),
+                beat_cnt.eq(0),
+                busy.eq(self.start),
+            ).Elif(bus.ack,
+                base_addr.eq(base_addr + _incr_adr),
+                self.recv_data.eq(self.recv_data + 1),
+                beat_cnt.eq(beat_cnt + 1),
+                If(beat_cnt == _last_beat,
+                    busy.eq(0),
+                )
             )
         ]
 
-    def add_debug(self, banner):
-        last_loop = Signal(32)
-        data_error_msg = " Data Error @ 0x\%0{}x: 0x\%0{}x vs 0x\%0{}x".format(
-            self.adr_width//4,
-            self.dw//4,
-            self.dw//4)
-        self.sync += [
-            If(self.data_error,
-                Display(banner + data_error_msg,
-                    self.bus.adr,
-                    self.bus.dat_r,
-                    self.recv_data,
+        # Per-beat Display (one simulator print per read, off by default).
+        if verbose:
+            self.sync += [
+                If(bus.stb & bus.cyc & ~bus.we & bus.ack,
+                    Display("addr %08x %08x dat_r %08x -> %08x", base_addr, bus.adr, self.recv_data, bus.dat_r),
                 )
-            ),
-            timeline(self.data_error, [
-                (128, [Finish()])
-            ])
-        ]
+            ]
+
+    def add_debug(self, banner, finish_delay=1):
+        add_data_error_debug(self, banner, self.bus.adr, self.bus.dat_r, finish_delay)
+
+class WishbonePacketStreamerByte(WishbonePacketStreamer):
+    addressing = "byte"
+    adr_shift  = 0
+
+class WishbonePacketStreamerWord(WishbonePacketStreamer):
+    addressing = "word"
+    adr_shift  = 2
+
+class WishbonePacketCheckerByte(WishbonePacketChecker):
+    addressing = "byte"
+    adr_shift  = 0
+
+class WishbonePacketCheckerWord(WishbonePacketChecker):
+    addressing = "word"
+    adr_shift  = 2
+
+# Addressing: (Streamer class, Checker class).
+WISHBONE_PACKET_CLASSES = {
+    "byte": (WishbonePacketStreamerByte, WishbonePacketCheckerByte),
+    "word": (WishbonePacketStreamerWord, WishbonePacketCheckerWord),
+}
+
+# SDRAM --------------------------------------------------------------------------------------------
+
+def add_sdram_region(soc, name, origin, size, base_address=None):
+    """Expose a new LiteDRAM native port of soc as a region at origin (through the LiteDRAM Wishbone
+    bridge, that also does the SoC bus/native port data-width conversion)."""
+    # Request a LiteDRAM native port.
+    port = soc.sdram.crossbar.get_port()
+    port.data_width = 2**int(log2(port.data_width)) # Round to nearest power of 2.
+    base_address    = origin if base_address is None else base_address
+
+    # Add SDRAM region.
+    region = SoCRegion(
+        origin = origin,
+        size   = size,
+        mode   = "rwx")
+    soc.bus.add_region(name, region)
+
+    # Wishbone Slave <--> LiteDRAM bridge.
+    from litedram.frontend.wishbone import LiteDRAMWishbone2Native
+    wb_sdram = wishbone.Interface(
+        data_width    = soc.bus.data_width,
+        address_width = soc.bus.address_width,
+        addressing    = "word")
+    soc.bus.add_slave(name=name, slave=wb_sdram)
+    soc.add_module(name=f"{name}_wishbone_bridge", module=LiteDRAMWishbone2Native(
+        wishbone     = wb_sdram,
+        port         = port,
+        base_address = base_address
+    ))
@@ -8,7 +8,6 @@
 import argparse
 
 from migen import *
-from migen.genlib.misc import timeline
 
 from litex.gen import *
 
@@ -22,152 +21,9 @@ from litex.soc.integration.soc      import SoCRegion
 from litex.soc.integration.soc_core import *
 from litex.soc.integration.builder  import *
 
-from litex.soc.interconnect         import wishbone
-
 from litex.soc.interconnect.csr import *
 
-# Utils --------------------------------------------------------------------------------------------
-
-class WishbonetPacketStreamer(LiteXModule):
-    def __init__(self, addressing="byte", init_adr=0, init_val=0, dw=32, adr_width=64, max_len=0x100):
-        self.wb = wb = wishbone.Interface(dw=32, adr_width=64, addressing=addressing)
-
-        self.end   = Signal()
-        self.start = Signal()
-
-        # # #
-
-        # Parameters.
-        # -----------
-        _init_adr = init_adr if addressing == "byte" else init_adr >> 2
-        _incr_adr = 4 if addressing == "byte" else 1
-        _max_len  = max_len if addressing == "byte" else max_len >> 2
-
-        # Signals.
-        # --------
-        base_addr = Signal(adr_width)
-        sent_data = Signal(dw)
-        delay     = Signal(10)
-
-        # FSM.
-        # ----
-        self.fsm = fsm = FSM(reset_state="IDLE")
-        fsm.act("IDLE",
-            NextValue(base_addr, _init_adr),
-            NextValue(sent_data, init_val),
-            NextValue(delay, 0),
-            If(self.start,
-                NextState("WR_DAT"),
-            )
-        ),
-        fsm.act("WR_DAT",
-            NextValue(wb.dat_w, sent_data),
-            wb.adr.eq(base_addr),
-            wb.stb.eq(1),
-            wb.we.eq(1),
-            wb.cyc.eq(1),
-            wb.sel.eq(2**(32//8) - 1),
-            If(wb.ack,
-                NextState("WAIT_DELAY"),
-            )
-        ),
-        fsm.act("WAIT_DELAY",
-            NextValue(delay, delay + 1),
-            If(delay == 10,
-                NextValue(delay, 0),
-                NextValue(base_addr, base_addr + _incr_adr),
-                NextValue(sent_data, sent_data + 1),
-                If(_init_adr + _max_len - _incr_adr == base_addr,
-                    self.end.eq(1),
-                    NextState("IDLE"),
-                ).Else(
-                    NextState("WR_DAT"),
-                )
-            )
-        )
-
-class WishbonetPacketChecker(LiteXModule):
-    def __init__(self, addressing="byte", init_adr=0, init_val=0, dw=32, adr_width=64, max_len=0x100):
-        self.wb = wb = wishbone.Interface(dw=32, adr_width=64, addressing=addressing)
-
-        self.end   = Signal()
-        self.start = Signal()
-
-        # # #
-
-        # Parameters.
-        # -----------
-        self.dw        = dw
-        self.adr_width = adr_width
-        _init_adr      = init_adr if addressing == "byte" else init_adr >> 2
-        _incr_adr      = 4 if addressing == "byte" else 1
-        _max_len       = max_len if addressing == "byte" else max_len >> 2
-
-        # Signals.
-        # --------
-        self.data_error = Signal()
-        base_addr       = Signal(adr_width)
-        self.recv_data  = Signal(dw)
-
-        # FSM.
-        # ----
-        self.fsm = fsm = FSM(reset_state="IDLE")
-        fsm.act("IDLE",
-            NextValue(base_addr, _init_adr),
-            NextValue(self.recv_data, init_val),
-            If(self.start,
-                NextState("RD_DAT"),
-            )
-        ),
-        fsm.act("RD_DAT",
-            wb.adr.eq(base_addr),
-            wb.stb.eq(1),
-            wb.we.eq(0),
-            wb.cyc.eq(1),
-            wb.sel.eq(2**(32//8) - 1),
-            If(wb.ack,
-                If(wb.dat_r != self.recv_data,
-                    self.data_error.eq(1),
-                ),
-                NextState("WAIT_RD_ACK"),
-            )
-        ),
-        fsm.act("WAIT_RD_ACK",
-            NextValue(base_addr, base_addr + _incr_adr),
-            NextValue(self.recv_data, self.recv_data + 1),
-
-            If(_init_adr + _max_len - _incr_adr == base_addr,
-               self.end.eq(1),
-                NextState("IDLE"),
-            ).Else(
-                NextState("RD_DAT"),
-            )
-        )
-
-        self.sync += [
-            If(wb.stb & wb.cyc & ~wb.we & wb.ack,
-                Display("addr %08x %08x dat_r %08x -> %08x", base_addr, wb.adr, self.recv_data, wb.dat_r),
-            )
-        ]
-
-    def add_debug(self, banner):
-        last_loop = Signal(32)
-        data_error_msg = " Data Error @ 0x\%0{}x: 0x\%0{}x vs 0x\%0{}x".format(
-            self.adr_width//4,
-            self.dw//4,
-            self.dw//4)
-        self.sync += [
-            If(self.data_error,
-                Display(banner + data_error_msg,
-                    self.wb.adr,
-                    self.wb.dat_r,
-                    self.recv_data,
-                )
-            ),
-            timeline(self.data_error, [
-                (128, [Finish()])
-            ])
-        ]
+from utils import WISHBONE_PACKET_CLASSES
 
 # IOs ----------------------------------------------------------------------------------------------
 
@@ -187,13 +43,12 @@ class Platform(SimPlatform):
 # SimSoC -------------------------------------------------------------------------------------------
 
 class SimSoC(SoCMini):
-    def __init__(self, addressing="byte", default_trace=1):
+    def __init__(self, addressing="byte", default_trace=0):
         # Parameters.
         sys_clk_freq = int(1e6)
 
         # Platform.
         platform = Platform()
-        self.comb += platform.trace.eq(1)
 
         # CRG --------------------------------------------------------------------------------------
         self.crg = CRG(platform.request("sys_clk"))
@@ -212,23 +67,26 @@ class SimSoC(SoCMini):
             size   = 0x100,
         )
 
+        # Byte/Word specialized Wishbone Packet writer/checker.
+        streamer_cls, checker_cls = WISHBONE_PACKET_CLASSES[addressing]
+
         # Wishbone Packet writer.
         # -----------------------
-        self.pkt_stream_h = WishbonetPacketStreamer(addressing, 0x400000000, 0x12345678, 32, 64, 0x100)
-        self.pkt_stream_l = WishbonetPacketStreamer(addressing, 0x2_0000, 0xCAFEBEBE, 32, 64, 0x100)
+        self.pkt_stream_h = streamer_cls(0x400000000, 0x12345678, 32, 64, 0x100)
+        self.pkt_stream_l = streamer_cls(0x2_0000, 0xCAFEBEBE, 32, 64, 0x100)
 
         # Wishbone Packet checker.
         # -----------------------
-        self.pkt_check_h  = WishbonetPacketChecker(addressing, 0x400000000, 0x12345678, 32, 64, 0x100)
-        self.pkt_check_l  = WishbonetPacketChecker(addressing, 0x2_0000, 0xCAFEBEBE, 32, 64, 0x100)
+        self.pkt_check_h  = checker_cls(0x400000000, 0x12345678, 32, 64, 0x100)
+        self.pkt_check_l  = checker_cls(0x2_0000, 0xCAFEBEBE, 32, 64, 0x100)
 
         self.pkt_check_h.add_debug("[Checker High]")
         self.pkt_check_l.add_debug("[Checker Low]")
 
-        self.bus.add_master("streamer_high", self.pkt_stream_h.wb)
-        self.bus.add_master("checker_high",  self.pkt_check_h.wb)
-        self.bus.add_master("streamer_low",  self.pkt_stream_l.wb)
-        self.bus.add_master("checker_low",   self.pkt_check_l.wb)
+        self.bus.add_master("streamer_high", self.pkt_stream_h.bus)
+        self.bus.add_master("checker_high",  self.pkt_check_h.bus)
+        self.bus.add_master("streamer_low",  self.pkt_stream_l.bus)
+        self.bus.add_master("checker_low",   self.pkt_check_l.bus)
 
         # Pipeline sequence.
         # ------------------
@@ -255,6 +113,7 @@ class SimSoC(SoCMini):
 
         # Debug ------------------------------------------------------------------------------------
 
+        # Dump from reset only when tracing (--trace), the SimTrace CSR drives platform.trace.
         platform.add_debug(self, reset=default_trace)
 
 def main():
@@ -266,7 +125,7 @@ def main():
     sim_config = SimConfig(default_clk="sys_clk")
 
     # Create SoC.
-    soc = SimSoC(args.addressing)
+    soc = SimSoC(args.addressing, default_trace=args.trace)
     builder = Builder(soc)
     builder.build(sim_config=sim_config, **verilator_build_kwargs, run=1)
 